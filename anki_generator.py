@@ -3,56 +3,15 @@
 """
 import genanki
 import csv
+import os
 import hashlib
-from typing import Dict, List
-from pathlib import Path
+from typing import Dict, List, Tuple
 from csv_parser import CSVParser
 from tts_handler import TTSHandler
 
 
-class AnkiGenerator:
-    """Класс для генерации карточек Anki."""
-    
-    def __init__(self, parser: CSVParser, tts_handler: TTSHandler):
-        """
-        Инициализация генератора Anki.
-        
-        Args:
-            parser: Парсер CSV файлов
-            tts_handler: Обработчик TTS
-        """
-        self.parser = parser
-        self.tts_handler = tts_handler
-        
-        # Списки для отслеживания слов без перевода и ошибок обработки
-        self.words_without_translation = []
-        self.processing_errors = []
-        
-        # Создаем модель карточки
-        self.model = genanki.Model(
-            1607392319,  # Уникальный ID модели
-            'Chinese Dictionary Model',
-            fields=[
-                {'name': 'Word'},
-                {'name': 'Pronunciation'},
-                {'name': 'Front'},
-                {'name': 'Back'},
-                {'name': 'Examples'},
-                {'name': 'Audio'},
-            ],
-            templates=[
-                {
-                    'name': 'Card 1 (Front → Back)',
-                    'qfmt': '{{Front}}',
-                    'afmt': '{{FrontSide}}<hr id="answer">{{Back}}{{Examples}}',
-                },
-                {
-                    'name': 'Card 2 (Back → Front)',
-                    'qfmt': '{{Back}}',
-                    'afmt': '{{FrontSide}}<hr id="answer">{{Front}}{{Examples}}',
-                },
-            ],
-            css='''
+# Стили карточек (общие для всех моделей)
+_CARD_CSS = '''
             .card {
                 font-family: Arial, sans-serif;
                 font-size: 20px;
@@ -166,21 +125,130 @@ class AnkiGenerator:
                 color: #bbb;
             }
             '''
-        )
+
+# Модели создаются один раз при импорте модуля: они не зависят от данных словаря.
+# Поля и шаблоны у каждой модели свои, так как genanki дополняет эти словари при сохранении.
+
+# Модель с обоими типами карточек
+_CHINESE_MODEL = genanki.Model(
+    1607392319,  # Уникальный ID модели
+    'Chinese Dictionary Model',
+    fields=[
+        {'name': 'Word'},
+        {'name': 'Pronunciation'},
+        {'name': 'Front'},
+        {'name': 'Back'},
+        {'name': 'Examples'},
+        {'name': 'Audio'},
+    ],
+    templates=[
+        {
+            'name': 'Card 1 (Front → Back)',
+            'qfmt': '{{Front}}',
+            'afmt': '{{FrontSide}}<hr id="answer">{{Back}}{{Examples}}',
+        },
+        {
+            'name': 'Card 2 (Back → Front)',
+            'qfmt': '{{Back}}',
+            'afmt': '{{FrontSide}}<hr id="answer">{{Front}}{{Examples}}',
+        },
+    ],
+    css=_CARD_CSS
+)
+
+# Модель только с прямыми карточками
+_FRONT_TO_BACK_MODEL = genanki.Model(
+    1607392320,  # Уникальный ID модели для front_to_back
+    'Chinese Dictionary Model (Front to Back)',
+    fields=[
+        {'name': 'Word'},
+        {'name': 'Pronunciation'},
+        {'name': 'Front'},
+        {'name': 'Back'},
+        {'name': 'Examples'},
+        {'name': 'Audio'},
+    ],
+    templates=[
+        {
+            'name': 'Card 1 (Front → Back)',
+            'qfmt': '{{Front}}',
+            'afmt': '{{FrontSide}}<hr id="answer">{{Back}}{{Examples}}',
+        },
+    ],
+    css=_CARD_CSS
+)
+
+# Модель только с обратными карточками
+_BACK_TO_FRONT_MODEL = genanki.Model(
+    1607392321,  # Уникальный ID модели для back_to_front
+    'Chinese Dictionary Model (Back to Front)',
+    fields=[
+        {'name': 'Word'},
+        {'name': 'Pronunciation'},
+        {'name': 'Front'},
+        {'name': 'Back'},
+        {'name': 'Examples'},
+        {'name': 'Audio'},
+    ],
+    templates=[
+        {
+            'name': 'Card 2 (Back → Front)',
+            'qfmt': '{{Back}}',
+            'afmt': '{{FrontSide}}<hr id="answer">{{Front}}{{Examples}}',
+        },
+    ],
+    css=_CARD_CSS
+)
+
+
+class AnkiGenerator:
+    """Класс для генерации карточек Anki."""
     
-    def generate_front_html(self, word: str, pronunciation: str) -> str:
+    def __init__(self, parser: CSVParser, tts_handler: TTSHandler):
+        """
+        Инициализация генератора Anki.
+        
+        Args:
+            parser: Парсер CSV файлов
+            tts_handler: Обработчик TTS
+        """
+        self.parser = parser
+        self.tts_handler = tts_handler
+        
+        # Списки для отслеживания слов без перевода и ошибок обработки
+        # (записи хранятся кортежами (слово, произношение) и (слово, ошибка))
+        self.words_without_translation: List[Tuple[str, str]] = []
+        self.processing_errors: List[Tuple[str, str]] = []
+        
+        # Модель карточки общая для всех экземпляров генератора
+        self.model = _CHINESE_MODEL
+    
+    def _prefetch_audio(self, words: List[str]):
+        """
+        Заранее получает аудио для слов одним пакетом параллельных запросов
+        (готовые пути запоминает TTS обработчик).
+        """
+        if not words:
+            return
+        print(f"Получение озвучки для {len(words)} слов...")
+        self.tts_handler.get_audio_paths(words)
+    
+    def generate_front_html(self, word: str, pronunciation: str, audio_path: str = None) -> str:
         """
         Генерирует HTML для лицевой стороны карточки.
         
         Args:
             word: Слово
             pronunciation: Произношение
+            audio_path: Путь к аудио (если не задан, запрашивается у TTS обработчика)
             
         Returns:
             HTML строка
         """
-        audio_path = self.tts_handler.get_audio_path(word)
-        audio_tag = f'[sound:{Path(audio_path).name}]' if audio_path and Path(audio_path).exists() else ''
+        if audio_path is None:
+            audio_path = self.tts_handler.get_audio_path(word)
+        # Непустой путь от TTS обработчика означает, что файл существует
+        audio_tag = f'[sound:{os.path.basename(audio_path)}]' if audio_path else ''
         
         pron_html = f'<div class="pronunciation">{pronunciation}</div>' if pronunciation else ''
         
@@ -201,21 +269,17 @@ class AnkiGenerator:
         Returns:
             HTML строка
         """
-        html_parts = []
-        
         # 1. Переводы
         translations = word_data.get('translations', {})
-        if translations:
-            html_parts.append('<div class="translations">')
-            for word_type, meanings in translations.items():
-                if meanings:
-                    html_parts.append(f'<div class="translation-type">{word_type}:</div>')
-                    for meaning in meanings:
-                        if meaning.strip():
-                            html_parts.append(f'<div class="translation-meaning">• {meaning.strip()}</div>')
-            html_parts.append('</div>')
-        
-        return ''.join(html_parts)
+        sections = ''.join(
+            f'<div class="translation-type">{word_type}:</div>'
+            + ''.join(
+                f'<div class="translation-meaning">• {meaning}</div>'
+                for meaning in (m.strip() for m in meanings) if meaning
+            )
+            for word_type, meanings in translations.items() if meanings
+        )
+        return f'<div class="translations">{sections}</div>' if sections else ''
     
     def generate_examples_html(self, word: str, word_data: Dict) -> str:
         """
@@ -227,86 +291,121 @@ class AnkiGenerator:
         Returns:
             HTML строка
         """
-        html_parts = []
-        
         # 2. Разбор иероглифов
         characters = word_data.get('characters', [])
-        if characters:
-            html_parts.append('<div class="character-analysis">')
-            for char in characters:
-                analysis = self.parser.get_char_analysis(char, word)
-                
-                html_parts.append(f'<div class="char-item">')
-                
-                # Формируем строку с заголовком иероглифа и транскрипциями в одной строке
-                pronunciations = analysis.get('pronunciation', [])
-                if pronunciations:
-                    pron_str = ', '.join(pronunciations)
-                    html_parts.append(f'<div class="char-title">{char}</div><div class="char-pronunciation-inline">[{pron_str}]</div>')
-                else:
-                    html_parts.append(f'<div class="char-title">{char}</div>')
-                
-                # Слова с таким же иероглифом
-                words_with_char = analysis.get('words', [])
-                # Исключаем само слово из списка
-                words_with_char = [w for w in words_with_char if w != word]
-                if words_with_char:
-                    words_str = ', '.join(words_with_char[:10])  # Ограничиваем до 10 слов
-                    html_parts.append(f'<div class="char-words">Употребление: {words_str}</div>')
-                
-                # Иероглифы с идентичным звучанием
-                chars_with_same_pron = analysis.get('chars_with_same_pronunciation', [])
-                # Исключаем сам иероглиф из списка
-                chars_with_same_pron = [c for c in chars_with_same_pron if c != char]
-                if chars_with_same_pron:
-                    chars_str = ', '.join(chars_with_same_pron[:10])  # Ограничиваем до 10
-                    html_parts.append(f'<div class="char-pronunciation">Однозвучные: {chars_str}</div>')
-                 
-                html_parts.append('</div>')
-                
-            if 'wordHomophones' in word_data and word_data['wordHomophones']: 
-                wordHomophonesStr=', '.join(word_data['wordHomophones'])
-                html_parts.append(f'<div class="char-pronunciation">Слова, звучащие также: {wordHomophonesStr}</div>')
-            html_parts.append('</div>')
-        
-                
-        
-        return ''.join(html_parts)
+        if not characters:
+            return ''
+        
+        char_items = ''.join(self._char_item_html(char, word) for char in characters)
+        
+        word_homophones = word_data.get('wordHomophones')
+        homophones_html = (
+            f'<div class="char-pronunciation">Слова, звучащие также: {", ".join(word_homophones)}</div>'
+            if word_homophones else ''
+        )
+        return f'<div class="character-analysis">{char_items}{homophones_html}</div>'
+    
+    def _char_item_html(self, char: str, word: str) -> str:
+        """
+        Генерирует HTML разбора одного иероглифа слова.
+        
+        Args:
+            char: Иероглиф
+            word: Слово, в котором разбирается иероглиф
+            
+        Returns:
+            HTML строка
+        """
+        # Слова и омофоны приходят уже без самого слова и иероглифа, не более 10
+        analysis = self.parser.get_char_analysis(char, word, limit=10)
+        
+        # Формируем строку с заголовком иероглифа и транскрипциями в одной строке
+        pronunciations = analysis.get('pronunciation', [])
+        title_html = f'<div class="char-title">{char}</div>'
+        if pronunciations:
+            title_html += f'<div class="char-pronunciation-inline">[{", ".join(pronunciations)}]</div>'
+        
+        # Слова с таким же иероглифом
+        words_with_char = analysis.get('words', [])
+        words_html = (
+            f'<div class="char-words">Употребление: {", ".join(words_with_char)}</div>'
+            if words_with_char else ''
+        )
+        
+        # Иероглифы с идентичным звучанием
+        chars_with_same_pron = analysis.get('chars_with_same_pronunciation', [])
+        same_pron_html = (
+            f'<div class="char-pronunciation">Однозвучные: {", ".join(chars_with_same_pron)}</div>'
+            if chars_with_same_pron else ''
+        )
+        
+        return f'<div class="char-item">{title_html}{words_html}{same_pron_html}</div>'
     
     def add_word_without_translation(self, word: str, pronunciation: str = ""):
         """Добавляет слово без перевода в список."""
-        self.words_without_translation.append({
-            'word': word,
-            'pronunciation': pronunciation
-        })
+        self.words_without_translation.append((word, pronunciation))
 
     def add_processing_error(self, word: str, error: str):
         """Добавляет слово с ошибкой обработки в список."""
-        self.processing_errors.append({
-            'word': word,
-            'error': error
-        })
+        self.processing_errors.append((word, error))
 
     def generate_words_without_translation_csv(self, filename: str = "words_without_translation.csv"):
         """Генерирует CSV файл для слов без перевода."""
         with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['word', 'pronunciation']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            for item in self.words_without_translation:
-                writer.writerow(item)
+            writer = csv.writer(csvfile)
+            writer.writerow(['word', 'pronunciation'])
+            writer.writerows(self.words_without_translation)
         print(f"Файл '{filename}' сгенерирован с {len(self.words_without_translation)} словами без перевода.")
 
     def generate_processing_errors_csv(self, filename: str = "processing_errors.csv"):
         """Генерирует CSV файл для слов с ошибками обработки."""
         with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['word', 'error']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            for item in self.processing_errors:
-                writer.writerow(item)
+            writer = csv.writer(csvfile)
+            writer.writerow(['word', 'error'])
+            writer.writerows(self.processing_errors)
         print(f"Файл '{filename}' сгенерирован с {len(self.processing_errors)} ошибками обработки.")
 
+    def _build_note_fields(self, word: str, word_data: Dict) -> Tuple[List[str], str, str]:
+        """
+        Формирует содержимое заметки для одного слова.
+        
+        Args:
+            word: Слово
+            word_data: Данные о слове
+            
+        Returns:
+            Кортеж (поля заметки, GUID, путь к аудио или пустая строка)
+        """
+        pronunciation = word_data.get('pronunciation', '')
+        
+        word_data['wordHomophones'] = self.parser.get_homophones(word)
+        
+        # Аудио запрашивается один раз на карточку, чтобы тег [sound:...] и медиафайлы колоды совпадали
+        # (успешные пути кэширует TTS обработчик, неудачи повторяются в следующей колоде)
+        card_audio_path = self.tts_handler.get_audio_path(word)
+        
+        # Генерируем HTML
+        front_html = self.generate_front_html(word, pronunciation, card_audio_path)
+        back_html = self.generate_back_html(word, word_data)
+        examples_html = self.generate_examples_html(word, word_data)
+        
+        # Аудио вставляется на лицевую сторону через [sound:...], поле Audio шаблонами не используется
+        audio_field = ''
+        
+        # Генерируем GUID по слову и произношению для предотвращения дубликатов
+        # (пара однозначно определяет запись, а хэш не зависит от объема HTML)
+        guid = hashlib.md5(f"{word}|{pronunciation}".encode('utf-8')).hexdigest()
+        
+        fields = [
+            word,
+            pronunciation,
+            front_html,
+            back_html,
+            examples_html,
+            audio_field
+        ]
+        return fields, guid, card_audio_path
+    
     def generate_deck(self, deck_name: str = "Chinese Dictionary", output_file: str = "chinese_dict.apkg", card_types: List[str] = None):
         """
         Генерирует колоду Anki.
@@ -319,55 +418,6 @@ class AnkiGenerator:
         if card_types is None:
             card_types = ['front_to_back', 'back_to_front']
         
-        # Создаем отдельные модели для каждого типа карточек
-        models = {}
-        
-        if 'front_to_back' in card_types:
-            front_to_back_model = genanki.Model(
-                1607392320,  # Уникальный ID модели для front_to_back
-                'Chinese Dictionary Model (Front to Back)',
-                fields=[
-                    {'name': 'Word'},
-                    {'name': 'Pronunciation'},
-                    {'name': 'Front'},
-                    {'name': 'Back'},
-                    {'name': 'Examples'},
-                    {'name': 'Audio'},
-                ],
-                templates=[
-                    {
-                        'name': 'Card 1 (Front → Back)',
-                        'qfmt': '{{Front}}',
-                        'afmt': '{{FrontSide}}<hr id="answer">{{Back}}{{Examples}}',
-                    },
-                ],
-                css=self.model.css
-            )
-            models['front_to_back'] = front_to_back_model
-        
-        if 'back_to_front' in card_types:
-            back_to_front_model = genanki.Model(
-                1607392321,  # Уникальный ID модели для back_to_front
-                'Chinese Dictionary Model (Back to Front)',
-                fields=[
-                    {'name': 'Word'},
-                    {'name': 'Pronunciation'},
-                    {'name': 'Front'},
-                    {'name': 'Back'},
-                    {'name': 'Examples'},
-                    {'name': 'Audio'},
-                ],
-                templates=[
-                    {
-                        'name': 'Card 2 (Back → Front)',
-                        'qfmt': '{{Back}}',
-                        'afmt': '{{FrontSide}}<hr id="answer">{{Front}}{{Examples}}',
-                    },
-                ],
-                css=self.model.css
-            )
-            models['back_to_front'] = back_to_front_model
-        
         deck = genanki.Deck(
             2059400110,  # Уникальный ID колоды
             deck_name
@@ -376,8 +426,29 @@ class AnkiGenerator:
         words = self.parser.get_all_words()
         print(f"Генерация карточек для {len(words)} слов...")
         
+        # Озвучку для слов, которые попадут в колоду, получаем заранее пакетом
+        self._prefetch_audio([w for w in words if self.parser.get_word_data(w).get('has_translations')])
+        
+        # Выбираем модель в зависимости от типа карточки
+        if 'front_to_back' in card_types and 'back_to_front' in card_types:
+            # Если генерируем оба типа карточек, используем стандартную модель
+            note_model = self.model
+        elif 'front_to_back' in card_types:
+            # Если генерируем только прямые карточки
+            note_model = _FRONT_TO_BACK_MODEL
+        elif 'back_to_front' in card_types:
+            # Если генерируем только обратные карточки
+            note_model = _BACK_TO_FRONT_MODEL
+        else:
+            # По умолчанию используем стандартную модель
+            note_model = self.model
+        
         skipped_count = 0
         skipped_words = []
+        # Аудио собираем только для слов, которые были добавлены в колоду
+        audio_files = []
+        # Заметки копим в списке и передаем колоде одним присваиванием
+        notes = []
         
         for i, word in enumerate(words, 1):
             if i % 10 == 0:
@@ -386,8 +457,7 @@ class AnkiGenerator:
             word_data = self.parser.get_word_data(word)
             
             # Проверяем наличие переводов
-            translations = word_data.get('translations', {})
-            if not translations or not any(translations.values()):
+            if not word_data.get('has_translations'):
                 skipped_count += 1
                 skipped_words.append(word)
                 # Добавляем слово без перевода в список
@@ -395,69 +465,20 @@ class AnkiGenerator:
                 self.add_word_without_translation(word, pronunciation)
                 continue
             
-            pronunciation = word_data.get('pronunciation', '')
-            
-            
-            wordHomophones = []
-            for other_word in words:
-                if other_word!= word and self.parser.all_words_data[other_word]['pronunciation']==word_data['pronunciation']:
-                    wordHomophones.append(other_word)
-            word_data['wordHomophones'] = wordHomophones
+            fields, guid, card_audio_path = self._build_note_fields(word, word_data)
+            if card_audio_path:
+                audio_files.append(card_audio_path)
             
-            # Генерируем HTML
-            front_html = self.generate_front_html(word, pronunciation)
-            back_html = self.generate_back_html(word, word_data)
-            examples_html = self.generate_examples_html(word, word_data)
-            
-            # Получаем путь к аудио
-            audio_path = self.tts_handler.get_audio_path(word)
-            audio_path = ''
-            audio_field = Path(audio_path).name if audio_path else ''
-            
-            # Создаем заметку
-            # Генерируем GUID на основе содержимого карточки для предотвращения дубликатов
-            guid_content = f"{word}|{pronunciation}|{front_html}|{back_html}|{examples_html}"
-            guid = hashlib.md5(guid_content.encode('utf-8')).hexdigest()
-            
-            # Выбираем модель в зависимости от типа карточки
-            if 'front_to_back' in card_types and 'back_to_front' in card_types:
-                # Если генерируем оба типа карточек, используем стандартную модель
-                note_model = self.model
-            elif 'front_to_back' in card_types:
-                # Если генерируем только прямые карточки
-                note_model = models['front_to_back']
-            elif 'back_to_front' in card_types:
-                # Если генерируем только обратные карточки
-                note_model = models['back_to_front']
-            else:
-                # По умолчанию используем стандартную модель
-                note_model = self.model
-            
-            note = genanki.Note(
+            notes.append(genanki.Note(
                 model=note_model,
-                fields=[
-                    word,
-                    pronunciation,
-                    front_html,
-                    back_html,
-                    examples_html,
-                    audio_field
-                ],
+                fields=fields,
                 guid=guid
-            )
-            
-            deck.add_note(note)
+            ))
+        
+        deck.notes = notes
         
         # Добавляем аудио файлы в пакет
         package = genanki.Package(deck)
-        audio_files = []
-        # Собираем аудио только для слов, которые были добавлены в колоду
-        added_words = [w for w in words if w not in skipped_words]
-        for word in added_words:
-            audio_path = self.tts_handler.get_audio_path(word)
-            if audio_path and Path(audio_path).exists():
-                audio_files.append(audio_path)
-        
         if audio_files:
             package.media_files = audio_files
         
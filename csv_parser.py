@@ -2,8 +2,22 @@
 Модуль для парсинга CSV файлов с данными о словах и переводах.
 """
 import csv
-from typing import Dict, List, Tuple, Set
+import re
+from typing import Dict, Iterable, Iterator, List
 from collections import defaultdict
+from contextlib import contextmanager
+from itertools import islice
+
+# Знаки препинания, которые не считаются иероглифами
+_PUNCT = frozenset(',.!;-?')
+
+# Размер буфера чтения CSV файлов и образца для определения разделителя
+_READ_BUFFER_SIZE = 1 << 20
+_SAMPLE_SIZE = 8192
+
+# Часть строки переводов: "тип: значение1, значение2" (части разделены |).
+# Тип привязан к началу части: до первого двоеточия части, как при разбиении по |
+_TRANS_RE = re.compile(r'(?:^|(?<=\|))([^|:]*):([^|]*)')
 
 class CSVParser:
     """Класс для парсинга CSV файлов."""
@@ -12,30 +26,47 @@ class CSVParser:
         # Словарь для хранения всех слов с их данными
         self.all_words_data: Dict[str, Dict] = {}
         
-        # Словарь: произношение -> список иероглифов с этим произношением
-        self.pron_to_chars: Dict[str, List[str]] = defaultdict(list)
+        # Словарь: произношение -> иероглифы с этим произношением (упорядоченное множество)
+        self.pron_to_chars: Dict[str, Dict[str, None]] = defaultdict(dict)
         
-        # Словарь: иероглиф -> список его произношений
-        self.char_to_pron: Dict[str, List[str]] = defaultdict(list)
+        # Словарь: иероглиф -> его произношения (упорядоченное множество)
+        self.char_to_pron: Dict[str, Dict[str, None]] = defaultdict(dict)
                 
-        # Словарь: иероглиф -> список слов, содержащих этот иероглиф
-        self.char_to_words: Dict[str, Set[str]] = defaultdict(set)
+        # Словарь: иероглиф -> слова, содержащие этот иероглиф (упорядоченное множество)
+        self.char_to_words: Dict[str, Dict[str, None]] = defaultdict(dict)
         
         # Словарь: слово -> иероглиф -> произношение (для отслеживания конкретного произношения иероглифа в слове)
         self.word_char_pronunciation: Dict[str, Dict[str, str]] = defaultdict(dict)
+        
+        # Словарь: произношение слова -> слова с этим произношением (упорядоченное множество)
+        self.pron_to_words: Dict[str, Dict[str, None]] = defaultdict(dict)
+        
+        # Разбор иероглифов, не зависящий от слова (пересчитывается после разбора первого CSV)
+        self._char_info_cache: Dict[str, Dict] = {}
+
+    @staticmethod
+    @contextmanager
+    def _open_csv(filepath: str) -> Iterator[Iterator[List[str]]]:
+        """
+        Открывает CSV файл и возвращает csv.reader с автоматически определенным разделителем
+        (точка с запятой или запятая).
+        """
+        # Большой буфер чтения уменьшает число системных вызовов на больших файлах
+        with open(filepath, 'r', encoding='utf-8', newline='', buffering=_READ_BUFFER_SIZE) as f:
+            # Определяем разделитель по первой строке образца
+            sample = f.read(_SAMPLE_SIZE)
+            f.seek(0)
+            first_line = sample.partition('\n')[0]
+            delimiter = ';' if ';' in first_line else ','
+            yield csv.reader(f, delimiter=delimiter)
 
     def parse_first_csv(self, filepath: str):
         """
         Парсит первый CSV файл с данными о словах и иероглифах.
         Формат: первая_буква;произношение;иероглиф1;...;иероглиф9;слова1;...;слова5
         """
-        with open(filepath, 'r', encoding='utf-8') as f:
-            # Определяем разделитель автоматически
-            first_line = f.readline()
-            f.seek(0)
-            delimiter = ';' if ';' in first_line else ','
-            reader = csv.reader(f, delimiter=delimiter)
-            
+        self._char_info_cache.clear()
+        with self._open_csv(filepath) as reader:
             for row in reader:
                 if len(row) < 2:
                     continue
@@ -44,55 +75,53 @@ class CSVParser:
                 if not pronunciation:
                     continue
                     
-                # Извлекаем иероглифы (колонки 2-10)
-                characters = [char.strip() for char in row[2:11] if char.strip()]
-                
-                # Извлекаем слова (колонки 11-15)
-                words_lists = [words.strip() for words in row[11:16] if words.strip()]
+                # Извлекаем иероглифы (колонки 2-10) без знаков препинания, очищая каждую ячейку один раз
+                characters = [char for cell in row[2:11] if (char := cell.strip()) and char not in _PUNCT]
                 
                 # Сохраняем произношение для каждого иероглифа
                 for char in characters:
-                    if char not in [',', '.', '!', ';','-','?']:
-                        if (pronunciation not in self.char_to_pron[char]): self.char_to_pron[char].append(pronunciation)
-                        if (char not in self.pron_to_chars[pronunciation]): self.pron_to_chars[pronunciation].append(char)
-
-                # Обрабатываем слова
-                for words_str in words_lists:
-                    words = [w.strip() for w in words_str.split(',') if w.strip()]
-                    for word in words:
+                    self.char_to_pron[char][pronunciation] = None
+                    self.pron_to_chars[pronunciation][char] = None
+
+                # Обрабатываем слова (колонки 11-15, в каждой - список через запятую).
+                # Ячейки не очищаем заранее: пробелы убираются у каждого слова
+                for words_str in row[11:16]:
+                    for word in words_str.split(','):
+                        word = word.strip()
+                        if not word:
+                            continue
                         # Если слово еще не встречалось, добавляем его в общий список << Не обрабатывает иероглифы с разным звучанием и смыслом!!!!
-                        if word not in self.all_words_data:
+                        word_data = self.all_words_data.get(word)
+                        if word_data is None:
+                            # Иероглифы слова без знаков препинания и повторов, в порядке появления
+                            # (один проход по слову для обоих индексов)
+                            word_chars = list(dict.fromkeys(char for char in word if char not in _PUNCT))
                             self.all_words_data[word] = {
                                 'pronunciation': None,
-                                'characters':  []
+                                'characters': word_chars
                             }
-                            for char in list(word):
-                                if char not in [',', '.', '!', ';','-','?']:
-                                    if char not in self.all_words_data[word]['characters']:
-                                        self.all_words_data[word]['characters'].append(char)
-                                        
-                                    if word not in self.char_to_words[char]:
-                                        self.char_to_words[char].add(word)
+                            for char in word_chars:
+                                self.char_to_words[char][word] = None
+                        else:
+                            word_chars = word_data['characters']
                         
-                        # Сохраняем связь иероглиф -> слова и отслеживаем произношение каждого иероглифа в слове
-                        for char in characters:  # Только иероглифы из текущей строки (которые имеют это произношение)
-                            # Отслеживаем какое произношение используется для каждого иероглифа в слове
-                            # Устанавливаем произношение для иероглифа в слове, если иероглиф из текущей строки присутствует в слове
-                            if char in word:  # Проверяем, что иероглиф из текущей строки действительно есть в слове
-                                self.word_char_pronunciation[word][char] = pronunciation
+                        # Отслеживаем какое произношение используется для каждого иероглифа в слове:
+                        # берем только иероглифы из текущей строки (которые имеют это произношение),
+                        # действительно присутствующие в слове. Иероглифы слова уже сохранены,
+                        # поэтому временные множества на каждое вхождение слова не создаются
+                        matched_chars = {char: pronunciation for char in word_chars if char in characters}
+                        if matched_chars:
+                            # Одно обращение к defaultdict на слово вместо обращения на каждый иероглиф
+                            self.word_char_pronunciation[word].update(matched_chars)
+        
+        self._finalize()
 
     def parse_second_csv(self, filepath: str):
         """
         Парсит второй CSV файл с переводами.
         Формат: иероглиф;произношение;перевод (тип: значение | тип: значение)
         """
-        with open(filepath, 'r', encoding='utf-8') as f:
-            # Определяем разделитель автоматически
-            first_line = f.readline()
-            f.seek(0)
-            delimiter = ';' if ';' in first_line else ','
-            reader = csv.reader(f, delimiter=delimiter)
-            
+        with self._open_csv(filepath) as reader:
             for row in reader:
                 if len(row) < 3:
                     continue
@@ -107,42 +136,46 @@ class CSVParser:
                 # Парсим переводы по типам
                 translations = self._parse_translations(translation_str)
                 
-                # Обновляем данные слова
-                if word not in self.all_words_data:
+                # _parse_translations не возвращает пустых списков значений,
+                # поэтому непустой словарь означает наличие перевода
+                has_translations = bool(translations)
+                
+                # Обновляем данные слова (один поиск в словаре слов)
+                word_data = self.all_words_data.get(word)
+                if word_data is None:
                     self.all_words_data[word] = {
                         'pronunciation': pronunciation,
                         'characters': list(word),
-                        'translations': translations
+                        'translations': translations,
+                        'has_translations': has_translations
                     }
                 else:
                     # Всегда обновляем произношение из второго CSV
-                    self.all_words_data[word]['pronunciation'] = pronunciation
-                    self.all_words_data[word]['translations'] = translations
-                
-                # Сохраняем информацию о произношении для иероглифов
-                #for char in word:
-                #    self.char_to_pronunciations[char].append(pronunciation)
-                #    self.pronunciation_to_chars[pronunciation].append(char)
-                #    self.char_to_words[char].add(word)
+                    old_pronunciation = word_data['pronunciation']
+                    if old_pronunciation is not None and old_pronunciation != pronunciation:
+                        self.pron_to_words[old_pronunciation].pop(word, None)
+                    word_data['pronunciation'] = pronunciation
+                    word_data['translations'] = translations
+                    word_data['has_translations'] = has_translations
+                # Индексы иероглифов (произношения, омофоны, слова) строятся только
+                # по первому CSV и здесь не изменяются
+                self.pron_to_words[pronunciation][word] = None
 
     def _parse_translations(self, translation_str: str) -> Dict[str, List[str]]:
         """
         Парсит строку переводов в словарь по типам.
         Формат: "тип1: значение1, значение2 | тип2: значение3"
         """
-        translations = defaultdict(list)
-        # Разделяем по |
-        parts = [p.strip() for p in translation_str.split('|')]
-        for part in parts:
-            if ':' in part:
-                type_part, meaning = part.split(':', 1)
-                word_type = type_part.strip()
-                meaning = meaning.strip()
-                if word_type and meaning:
-                    # Разделяем значения по запятой
-                    meanings = [m.strip() for m in meaning.split(',') if m.strip()]
-                    translations[word_type].extend(meanings)
-        return dict(translations)
+        translations: Dict[str, List[str]] = {}
+        # Пары (тип, значения) находятся одним проходом регулярного выражения
+        for match in _TRANS_RE.finditer(translation_str):
+            # Части с пустым типом пропускаются
+            word_type = match.group(1).strip()
+            # Разделяем значения по запятой
+            meanings = [m for m in (s.strip() for s in match.group(2).split(',')) if m]
+            if word_type and meanings:
+                translations.setdefault(word_type, []).extend(meanings)
+        return translations
 
     def get_word_data(self, word: str) -> Dict:
         """Возвращает данные для слова."""
@@ -152,38 +185,88 @@ class CSVParser:
         """Возвращает список всех уникальных слов."""
         return list(self.all_words_data.keys())
 
-    def get_char_analysis(self, char: str, word: str = None) -> Dict:
+    def get_homophones(self, word: str) -> List[str]:
+        """Возвращает слова с тем же произношением, что и у слова (без самого слова)."""
+        word_data = self.all_words_data.get(word)
+        pronunciation = word_data['pronunciation'] if word_data is not None else None
+        if pronunciation is None or pronunciation not in self.pron_to_words:
+            return []
+        return [w for w in self.pron_to_words[pronunciation] if w != word]
+
+    def _finalize(self):
+        """
+        Заранее вычисляет разбор (произношения, слова, омофоны) для всех известных иероглифов,
+        чтобы get_char_analysis сводился к поиску в словаре.
+        Омофоны для произношения иероглифа в конкретном слове отдельно не хранятся:
+        это готовый список pron_to_chars[произношение].
+        """
+        self._char_info_cache.clear()
+        for char in self.char_to_pron.keys() | self.char_to_words.keys():
+            self._get_char_info(char)
+
+    def _get_char_info(self, char: str) -> Dict:
+        """
+        Возвращает не зависящую от слова часть разбора иероглифа.
+        Для иероглифов, не попавших в _finalize, результат вычисляется при первом обращении.
+        """
+        info = self._char_info_cache.get(char)
+        if info is None:
+            # Индексы - defaultdict: проверяем наличие ключа, чтобы не создавать пустые записи
+            # и не выделять пустой контейнер по умолчанию на каждый вызов
+            pronunciations = self.char_to_pron[char] if char in self.char_to_pron else ()
+            # Кэш хранит кортежи: записи общие для всех вызовов и не изменяются вызывающим кодом
+            info = {
+                'pronunciation': tuple(pronunciations),
+                'words': tuple(self.char_to_words[char] if char in self.char_to_words else ()),
+                # Все омофоны по всем произношениям иероглифа, объединенные за один проход
+                'chars_with_same_pronunciation': tuple(dict.fromkeys(
+                    homophone
+                    for pron in pronunciations
+                    # Произношения из char_to_pron всегда есть в pron_to_chars
+                    for homophone in self.pron_to_chars[pron]
+                ))
+            }
+            self._char_info_cache[char] = info
+        return info
+
+    @staticmethod
+    def _exclude(items: Iterable[str], item: str, limit: int = None) -> List[str]:
+        """
+        Возвращает список элементов без item (элементы не повторяются).
+        При заданном limit копируется только начало последовательности, а не вся она.
+        """
+        head = list(items) if limit is None else list(islice(items, limit + 1))
+        if item in head:
+            head.remove(item)
+        return head if limit is None else head[:limit]
+
+    def get_char_analysis(self, char: str, word: str = None, limit: int = None) -> Dict:
         """
         Возвращает разбор иероглифа:
-        - слова с таким же иероглифом
-        - иероглифы с идентичным звучанием (омофоны)
+        - слова с таким же иероглифом (без самого слова)
+        - иероглифы с идентичным звучанием (омофоны, без самого иероглифа)
+        Если задан limit, списки слов и омофонов ограничиваются limit элементами.
+        Произношения возвращаются кортежем, общим для всех вызовов.
         """
-        words_with_char = []
-        for word_with_char in self.char_to_words.get(char, set()):
-            if word_with_char != word:
-                words_with_char.append(word_with_char )
-        
-        # Используем сохраненные омофоны
+        info = self._get_char_info(char)
         
-        homophones = []
+        # Получаем произношение иероглифа в конкретном слове (если оно известно)
+        char_pronunciation = None
+        if word:
+            word_pronunciations = self.word_char_pronunciation.get(word)
+            if word_pronunciations:
+                char_pronunciation = word_pronunciations.get(char)
         
         # Если указано слово, ищем только омофоны с тем же произношением, что и в слове
-        if word and word in self.word_char_pronunciation and char in self.word_char_pronunciation[word]:
-            # Получаем произношение иероглифа в конкретном слове
-            char_pronunciation = self.word_char_pronunciation[word][char]
+        if char_pronunciation is not None:
             # Ищем только иероглифы с этим же произношением
-            for homophone in self.pron_to_chars.get(char_pronunciation, set()):
-                if homophone not in homophones and homophone != char:
-                    homophones.append(homophone)
+            homophones = self.pron_to_chars[char_pronunciation] if char_pronunciation in self.pron_to_chars else ()
         else:
             # Старое поведение: показываем все омофоны
-            for pron in self.char_to_pron.get(char, set()):
-                for homophone in self.pron_to_chars.get(pron, set()):
-                    if homophone not in homophones:
-                        homophones.append(homophone )
+            homophones = info['chars_with_same_pronunciation']
        
         return {
-            'pronunciation': self.char_to_pron[char].copy(),
-            'words': words_with_char,
-            'chars_with_same_pronunciation': homophones
+            'pronunciation': info['pronunciation'],
+            'words': self._exclude(info['words'], word, limit),
+            'chars_with_same_pronunciation': self._exclude(homophones, char, limit)
         }
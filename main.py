@@ -115,6 +115,8 @@ def main():
         card_types=['back_to_front']
     )
     
+    tts_handler.cleanup()
+    
     print("\nГотово!")
 
 
@@ -31,9 +31,9 @@ def main():
     # Проверка начальных данных
     print("\n2. Начальные данные:")
     print(f"   Слова: {list(parser.all_words_data.keys())}")
-    print(f"   Произношения: {dict(parser.pron_to_chars)}")
-    print(f"   Иероглифы по произношению: {dict(parser.char_to_pron)}")
-    print(f"   Слова по иероглифам: {dict(parser.char_to_words)}")
+    print(f"   Произношения: { {pron: list(chars) for pron, chars in parser.pron_to_chars.items()} }")
+    print(f"   Иероглифы по произношению: { {char: list(prons) for char, prons in parser.char_to_pron.items()} }")
+    print(f"   Слова по иероглифам: { {char: list(words) for char, words in parser.char_to_words.items()} }")
     
    # Примеры работы с конкретными словами
     print("\n4. Данные по словам:")
@@ -5,8 +5,14 @@ import os
 from pathlib import Path
 from gtts import gTTS
 import hashlib
-import threading
-import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import Dict, Iterable, Optional, Tuple
+
+# Таймаут генерации одного аудио файла, секунды
+_GENERATION_TIMEOUT = 3.0
+
+# Число потоков для запросов к TTS
+_MAX_WORKERS = 16
 
 class TTSHandler:
     """Класс для обработки TTS (Text-to-Speech)."""
@@ -22,6 +28,23 @@ class TTSHandler:
         self.audio_dir = Path(audio_dir)
         self.lang = lang
         self.audio_dir.mkdir(exist_ok=True)
+        
+        # Хэши уже сгенерированных аудио файлов: содержимое директории читается один раз,
+        # дальше наличие файла проверяется по множеству без обращения к файловой системе
+        with os.scandir(self.audio_dir) as entries:
+            self._cached_hashes = {
+                entry.name[:-len('.mp3')] for entry in entries
+                if entry.name.endswith('.mp3') and entry.is_file()
+            }
+        
+        # Кэш в памяти: текст -> путь к готовому аудио файлу
+        self._path_cache: Dict[str, str] = {}
+        
+        # Переиспользуемый пул потоков для генерации (вместо нового потока на каждый запрос)
+        self._executor = ThreadPoolExecutor(max_workers=_MAX_WORKERS, thread_name_prefix='tts')
+        
+        # Выполняющиеся генерации: хэш имени файла -> задача в пуле
+        self._generating: Dict[str, Future] = {}
     
     def get_audio_path(self, text: str) -> str:
         #return ""
@@ -34,49 +57,130 @@ class TTSHandler:
         Returns:
             Путь к аудио файлу
         """
+        # Повторные запросы того же текста не требуют ни хэширования, ни проверок
+        cached_path = self._path_cache.get(text)
+        if cached_path is not None:
+            return cached_path
+        return self.get_audio_paths((text,))[text]
+    
+    def _find_audio(self, text: str) -> Tuple[str, Path, bool]:
+        """
+        Ищет аудио файл для текста в кэше на диске.
+        
+        Returns:
+            Хэш имени файла, путь к файлу и признак того, что файл уже существует
+        """
         # Создаем уникальное имя файла на основе текста
-        hash_name = hashlib.md5(text.encode('utf-8')).hexdigest()
+        # (BLAKE2b быстрее MD5 на коротких строках; криптостойкость здесь не нужна)
+        text_bytes = text.encode('utf-8')
+        hash_name = hashlib.blake2b(text_bytes, digest_size=16).hexdigest()
         audio_path = self.audio_dir / f"{hash_name}.mp3"
         
         # Если файл уже существует, возвращаем его
-        if audio_path.exists():
-            return str(audio_path)
+        if hash_name in self._cached_hashes:
+            return hash_name, audio_path, True
         
-        # Генерируем новый аудио файл
+        # Файл из кэша старого формата (имя по MD5) переименовываем, а не генерируем заново
+        legacy_hash = hashlib.md5(text_bytes).hexdigest()
+        if legacy_hash in self._cached_hashes:
+            legacy_path = self.audio_dir / f"{legacy_hash}.mp3"
+            try:
+                legacy_path.replace(audio_path)
+            except OSError:
+                return hash_name, legacy_path, True
+            self._cached_hashes.discard(legacy_hash)
+            self._cached_hashes.add(hash_name)
+            return hash_name, audio_path, True
+        
+        return hash_name, audio_path, False
+    
+    def _submit_audio(self, text: str, hash_name: str, audio_path: Path) -> Optional[Future]:
+        """
+        Ставит генерацию аудио файла в пул потоков (None, если задачу поставить не удалось).
+        Если генерация того же файла еще выполняется, возвращает ее задачу вместо новой.
+        """
+        # Генерация, не уложившаяся в таймаут ожидания, продолжается и может записать файл позже:
+        # повторный запрос ждет ее, а не отправляет второй запрос к TTS в тот же файл
+        future = self._generating.get(hash_name)
+        if future is not None and not future.done():
+            return future
         try:
-            # Создаем событие для синхронизации
-            completion_event = threading.Event()
-            generation_error = None
-            
-            def generate_audio():
-                nonlocal generation_error
-                try:
-                    tts = gTTS(text=text, lang=self.lang, slow=False)
-                    tts.save(str(audio_path))
-                except Exception as e:
-                    generation_error = e
-                finally:
-                    completion_event.set()
-            
-            # Запускаем генерацию в отдельном потоке
-            thread = threading.Thread(target=generate_audio)
-            thread.daemon = True
-            thread.start()
-            
-            # Ожидаем завершения с таймаутом 3 секунды
-            if completion_event.wait(timeout=3.0):
-                if generation_error:
-                    raise generation_error
-                return str(audio_path)
-            else:
-                # Таймаут превышен
-                print(f"Таймаут при генерации аудио для '{text}': превышено время ожидания 3 секунды")
-                return ""
+            future = self._executor.submit(self._generate_audio, text, audio_path)
         except Exception as e:
+            # Например, пул уже остановлен методом cleanup()
             print(f"Ошибка при генерации аудио для '{text}': {e}")
+            return None
+        self._generating[hash_name] = future
+        # Завершившаяся генерация запоминается, даже если ее уже никто не ждет
+        future.add_done_callback(lambda done: self._on_audio_generated(hash_name, done))
+        return future
+    
+    def _on_audio_generated(self, hash_name: str, future: Future):
+        """Добавляет хэш в кэш, если генерация завершилась без ошибки."""
+        if not future.cancelled() and future.exception() is None:
+            self._cached_hashes.add(hash_name)
+        if self._generating.get(hash_name) is future:
+            del self._generating[hash_name]
+    
+    def _wait_for_audio(self, text: str, hash_name: str, audio_path: Path, future: Optional[Future]) -> str:
+        """Ожидает генерацию аудио файла и возвращает путь к нему (пустая строка при ошибке)."""
+        if future is None:
+            return ""
+        try:
+            # Ожидаем завершения с таймаутом
+            future.result(timeout=_GENERATION_TIMEOUT)
+        except FuturesTimeoutError:
+            # Таймаут превышен
+            print(f"Таймаут при генерации аудио для '{text}': превышено время ожидания {_GENERATION_TIMEOUT:g} секунды")
             return ""
+        except Exception as e:
+            print(f"Ошибка при генерации аудио для '{text}': {e}")
+            return ""
+        # Обратный вызов может выполниться уже после возврата result(), поэтому хэш добавляется и здесь
+        self._cached_hashes.add(hash_name)
+        return str(audio_path)
+    
+    def _generate_audio(self, text: str, audio_path: Path):
+        """Генерирует аудио файл через gTTS (выполняется в пуле потоков)."""
+        # Сетевой таймаут gTTS не дает зависшему запросу навсегда занять поток пула
+        tts = gTTS(text=text, lang=self.lang, slow=False, timeout=_GENERATION_TIMEOUT)
+        tts.save(str(audio_path))
+    
+    def get_audio_paths(self, texts: Iterable[str]) -> Dict[str, str]:
+        """
+        Генерирует или возвращает пути к аудио файлам для нескольких текстов.
+        Все недостающие файлы сразу ставятся в пул генерации и выполняются параллельно:
+        время уходит на ожидание сети, во время которого потоки не держат GIL.
+        
+        Args:
+            texts: Тексты для озвучки
+            
+        Returns:
+            Словарь: текст -> путь к аудио файлу (пустая строка при ошибке)
+        """
+        audio_paths: Dict[str, str] = {}
+        pending = []
+        for text in dict.fromkeys(texts):
+            cached_path = self._path_cache.get(text)
+            if cached_path is None:
+                hash_name, audio_path, exists = self._find_audio(text)
+                if not exists:
+                    # Путь заполняется после ожидания генерации (порядок текстов сохраняется)
+                    audio_paths[text] = ""
+                    pending.append((text, hash_name, audio_path, self._submit_audio(text, hash_name, audio_path)))
+                    continue
+                cached_path = self._path_cache[text] = str(audio_path)
+            audio_paths[text] = cached_path
+        
+        for text, hash_name, audio_path, future in pending:
+            result_path = self._wait_for_audio(text, hash_name, audio_path, future)
+            # Неудачи не кэшируем, чтобы следующий запрос мог повторить генерацию
+            if result_path:
+                self._path_cache[text] = result_path
+            audio_paths[text] = result_path
+        return audio_paths
     
     def cleanup(self):
-        """Очищает кэш аудио файлов (опционально)."""
+        """Останавливает пул потоков генерации (ожидающие в очереди генерации отменяются)."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
         # Можно добавить логику очистки старых файлов
-        pass